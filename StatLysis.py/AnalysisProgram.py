@@ -1,18 +1,24 @@
 import os
+import glob
+import importlib.util
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 import pandas as pd
 import numpy as np
 import seaborn as sns
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from scipy import stats
 from statsmodels.formula.api import ols
 import statsmodels.api as sm
 from statsmodels.stats.multicomp import pairwise_tukeyhsd
 from sklearn.metrics import r2_score
-from scipy.optimize import curve_fit
+from scipy.optimize import least_squares
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from concurrent.futures import ThreadPoolExecutor
 import warnings
+from collections import namedtuple
+from functools import lru_cache
+from patsy import dmatrices
 
 # Suppress rank warning from polyfit
 import warnings
@@ -20,6 +26,20 @@ import warnings
 # Suprimir o aviso de ajuste mal condicionado do polyfit
 warnings.filterwarnings("ignore", category=UserWarning, message=".*Polyfit may be poorly conditioned.*")
 
+# Prefer the Rust-backed calamine reader when installed and supported (pandas >= 2.2), openpyxl otherwise
+_PANDAS_VERSION = tuple(int(v) for v in pd.__version__.split('.')[:2])
+if importlib.util.find_spec('python_calamine') is not None and _PANDAS_VERSION >= (2, 2):
+    EXCEL_ENGINE = 'calamine'
+else:
+    EXCEL_ENGINE = 'openpyxl'
+
+# Arrow's Parquet writer for an extra copy of the filtered data, when installed
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pa_parquet
+except ImportError:
+    pa = None
+
 
 # ========== 📁 DATA LOADING ==========
 
@@ -35,78 +55,239 @@ def parse_metadata_from_filename(filename):
     except IndexError:
         return {k: 'Unknown' for k in ['CellLine', 'Radiation', 'NP', 'Dose']}
 
-def read_aggregated_excel(filepath):
-    metadata = parse_metadata_from_filename(os.path.basename(filepath))
+FILENAME_PATTERN = r'^[^_]*_(?P<CellLine>[^_]*)_(?P<Radiation>[^_]*)_(?P<NP>[^_]*)_(?P<Dose>[^_]*)'
+
+def parse_metadata_from_filenames(paths):
+    # Same fields as parse_metadata_from_filename, extracted for all files in one regex pass
+    meta = pd.Series([os.path.splitext(os.path.basename(p))[0] for p in paths], dtype=object).str.extract(FILENAME_PATTERN)
+    meta['Dose'] = meta['Dose'].str.replace("Gy", "", regex=False).str.strip()
+    return meta.fillna('Unknown').to_dict('records')
+
+def read_aggregated_excel(filepath, metadata=None, errors=None):
+    if metadata is None:
+        metadata = parse_metadata_from_filename(os.path.basename(filepath))
     try:
-        xls = pd.ExcelFile(filepath)
-        df = pd.read_excel(xls, sheet_name=xls.sheet_names[0])
-        for k, v in metadata.items():
-            df[k] = v
+        df = pd.read_excel(filepath, sheet_name=0, engine=EXCEL_ENGINE, decimal=',')
+        # Mixed columns can still arrive as text: convert in one pass, keep only if fully numeric
         for col in df.select_dtypes(include='object'):
-            if df[col].str.contains(',', regex=False).any():
-                try:
-                    df[col] = df[col].str.replace(',', '.').astype(float)
-                except:
-                    pass
-        return df
+            converted = pd.to_numeric(df[col].astype(str).str.replace(',', '.', regex=False)
+                                      .where(df[col].notna()), errors='coerce')
+            if converted.notna().sum() == df[col].notna().sum():
+                df[col] = converted
+        return df.assign(**metadata)
     except Exception as e:
-        messagebox.showerror("Read Error", f"{filepath}:\n{e}")
+        if errors is None:
+            messagebox.showerror("Read Error", f"{filepath}:\n{e}")
+        else:
+            errors.append(f"{filepath}:\n{e}")
         return pd.DataFrame()
 
 def load_all_aggregated_data(folder):
-    dfs = []
-    for fname in os.listdir(folder):
-        if fname.endswith('.xlsx') and fname.startswith('Aggregated_'):
-            df = read_aggregated_excel(os.path.join(folder, fname))
-            if not df.empty:
-                dfs.append(df)
+    paths = sorted(glob.glob(os.path.join(glob.escape(folder), 'Aggregated_*.xlsx')))
+    if not paths:
+        return pd.DataFrame()
+    metas = parse_metadata_from_filenames(paths)
+    # Files are independent: read them in parallel, report errors from the Tk thread afterwards
+    errors = []
+    with ThreadPoolExecutor(max_workers=min(8, len(paths))) as ex:
+        dfs = [df for df in ex.map(lambda p, m: read_aggregated_excel(p, m, errors), paths, metas) if not df.empty]
+    if errors:
+        messagebox.showerror("Read Error", "\n\n".join(errors))
     return pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame()
 
 # ========== 🔄 PREPROCESSING ==========
 
 def remove_outliers(df, response_var, z_thresh=3):
-    z = np.abs(stats.zscore(df[response_var], nan_policy='omit'))
+    x = df[response_var].to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.abs(x - np.nanmean(x)) / np.nanstd(x)
     return df[z < z_thresh], int((z >= z_thresh).sum())
 
 def apply_normalization(df, response_var, method):
+    if method not in ('log1p', 'zscore', 'minmax'):
+        return df
+    # One private float buffer, transformed in place and written back once
+    x = df[response_var].to_numpy(dtype=float, copy=True)
     if method == 'log1p':
-        df[response_var] = np.log1p(df[response_var])
+        np.log1p(x, out=x)
     elif method == 'zscore':
-        df[response_var] = (df[response_var] - df[response_var].mean()) / df[response_var].std()
+        x -= np.nanmean(x)
+        x /= np.nanstd(x, ddof=1)
     elif method == 'minmax':
-        df[response_var] = (df[response_var] - df[response_var].min()) / (df[response_var].max() - df[response_var].min())
+        mn = np.nanmin(x)
+        x -= mn
+        x /= np.nanmax(x)
+    df[response_var] = x
     return df
 
+DERIVED_VARS = {
+    'ROS_per_Nucleus': ('NumROS', 'NumNuclei'),
+    'Fluo_per_Nucleus': ('TotalROSFluorescence', 'NumNuclei'),
+    'Area_per_ROS': ('TotalROSArea', 'NumROS'),
+    'LDAreaRed_per_Nucleus': ('TotalLDAreaRed', 'NumNuclei'),
+}
+
 def create_derived_vars(df):
-    if 'NumROS' in df.columns and 'NumNuclei' in df.columns:
-        df['ROS_per_Nucleus'] = df['NumROS'] / df['NumNuclei']
-    if 'TotalROSFluorescence' in df.columns and 'NumNuclei' in df.columns:
-        df['Fluo_per_Nucleus'] = df['TotalROSFluorescence'] / df['NumNuclei']
-    if 'TotalROSArea' in df.columns and 'NumROS' in df.columns:
-        df['Area_per_ROS'] = df['TotalROSArea'] / df['NumROS']
-    if 'TotalLDAreaRed' in df.columns and 'NumNuclei' in df.columns:
-        df['LDAreaRed_per_Nucleus'] = df['TotalLDAreaRed'] / df['NumNuclei']
-    return df
+    new = {}
+    for name, (num, den) in DERIVED_VARS.items():
+        if num in df.columns and den in df.columns:
+            n = df[num].to_numpy(dtype=float)
+            d = df[den].to_numpy(dtype=float)
+            # Zero denominators give NaN instead of inf
+            new[name] = np.divide(n, d, out=np.full(len(df), np.nan), where=d != 0)
+    return df.assign(**new)
 
 # ========== 📊 STATISTICAL ANALYSIS ==========
 
-def perform_anova(df, response_var, factors):
+class _FitData:
+    # Hashable view of the columns a fit uses, so fits can be memoized with lru_cache
+    def __init__(self, df, columns):
+        self.df = df[list(dict.fromkeys(columns))]
+        self.key = int(pd.util.hash_pandas_object(self.df, index=False).sum())
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __eq__(self, other):
+        # The digest only buckets; a full compare keeps a hash collision from returning another dataset's fit
+        return self.key == other.key and self.df.equals(other.df)
+
+def clear_fit_cache():
+    _perform_anova.cache_clear()
+    _run_regression.cache_clear()
+
+AnovaFit = namedtuple('AnovaFit', ['params', 'ssr', 'df_resid', 'mse_resid', 'nobs'])
+
+def _lstsq_fit(X, y):
+    # Least-squares fit returning coefficients, residual sum of squares and rank
+    beta, _, rank, _ = np.linalg.lstsq(X, y, rcond=None)
+    resid = y - X @ beta
+    return beta, float(resid @ resid), int(rank)
+
+def _type2_anova(formula, df):
+    # Type-II sums of squares from column subsets of the full design matrix,
+    # matching anova_lm(typ=2) without building a statsmodels results object
+    y, X = dmatrices(formula, df, return_type='dataframe')
+    y, Xv = y.to_numpy().ravel(), X.to_numpy()
+    info = X.design_info
+    beta, ssr, rank = _lstsq_fit(Xv, y)
+    df_resid = len(y) - rank
+    model = AnovaFit(pd.Series(beta, index=X.columns), ssr, df_resid, ssr / df_resid, len(y))
+
+    terms = [t for t in info.terms if t.factors]
+    cols = {t: np.arange(Xv.shape[1])[info.term_slices[t]] for t in info.terms}
+    rows = {}
+    for term in terms:
+        factors = set(term.factors)
+        kept = [t for t in info.terms if t != term and not factors <= set(t.factors)]
+        reduced = np.concatenate([cols[t] for t in kept]) if kept else np.array([], dtype=int)
+        _, ssr_red, rank_red = _lstsq_fit(Xv[:, reduced], y)
+        _, ssr_aug, rank_aug = _lstsq_fit(Xv[:, np.concatenate([reduced, cols[term]])], y)
+        rows[term.name()] = (ssr_red - ssr_aug, rank_aug - rank_red)
+
+    anova = pd.DataFrame.from_dict(rows, orient='index', columns=['sum_sq', 'df'])
+    anova['df'] = anova['df'].astype(float)
+    anova['F'] = (anova['sum_sq'] / anova['df']) / model.mse_resid
+    anova['PR(>F)'] = stats.f.sf(anova['F'], anova['df'], df_resid)
+    anova.loc['Residual'] = [ssr, df_resid, np.nan, np.nan]
+    return model, anova
+
+def perform_anova(df, response_var, factors, use_fast=True):
+    return _perform_anova(_FitData(df, [response_var, *factors]), response_var, tuple(factors), use_fast)
+
+@lru_cache(maxsize=32)
+def _perform_anova(data, response_var, factors, use_fast):
+    df = data.df
     formula = f"{response_var} ~ " + ' + '.join([f'C({f})' for f in factors]) + ' + ' + ':'.join([f'C({f})' for f in factors])
-    model = ols(formula, data=df).fit()
-    anova = sm.stats.anova_lm(model, typ=2)
+    if use_fast:
+        model, anova = _type2_anova(formula, df)
+    else:
+        model = ols(formula, data=df).fit()
+        anova = sm.stats.anova_lm(model, typ=2)
     anova['eta_sq'] = anova['sum_sq'] / (anova['sum_sq'].sum() + model.ssr)
     return model, anova
 
-def run_tukey(df, response_var, factor):
+def fast_tukey(df, response_var, factor, mse=None, dof=None, alpha=0.05):
+    # Tukey-Kramer HSD on group means, all pairs broadcast at once; same rows as pairwise_tukeyhsd
+    g = df.groupby(factor, observed=True)[response_var].agg(['mean', 'count', 'var'])
+    means, n = g['mean'].to_numpy(), g['count'].to_numpy()
+    k = len(g)
+    if (mse is None) != (dof is None):
+        raise ValueError("fast_tukey: pass mse and dof together (e.g. a fit's mse_resid and df_resid)")
+    if mse is None:
+        # Pooled within-group variance of this factor alone, as pairwise_tukeyhsd uses
+        dof = n.sum() - k
+        mse = np.nansum(g['var'].to_numpy() * (n - 1)) / dof
+    i, j = np.triu_indices(k, 1)
+    diff = means[j] - means[i]
+    se = np.sqrt(mse / 2 * (1 / n[i] + 1 / n[j]))
+    p_adj = stats.studentized_range.sf(np.abs(diff) / se, k, dof)
+    half = stats.studentized_range.ppf(1 - alpha, k, dof) * se
+    levels = g.index.to_numpy()
+    table = pd.DataFrame({
+        'group1': levels[i], 'group2': levels[j], 'meandiff': np.round(diff, 4), 'p-adj': np.round(p_adj, 4),
+        'lower': np.round(diff - half, 4), 'upper': np.round(diff + half, 4), 'reject': p_adj < alpha,
+    })
+    text = f"Multiple Comparison of Means - Tukey HSD, FWER={alpha:.2f}\n" + table.to_string(index=False)
+    return text, [list(table.columns)] + table.values.tolist()
+
+def run_tukey(df, response_var, factor, use_fast=True):
     if df[factor].nunique() < 2:
         return f"Tukey HSD skipped: only one group in '{factor}'"
+    if use_fast:
+        return fast_tukey(df, response_var, factor)
     tukey = pairwise_tukeyhsd(df[response_var], df[factor])
     return tukey.summary().as_text(), tukey._results_table.data
 
-def run_regression(df, response_var, num_var, cat_var):
+RegressionFit = namedtuple('RegressionFit', ['params', 'bse', 'tvalues', 'pvalues', 'rsquared', 'nobs', 'df_resid'])
+
+def _ols_fit(formula, df):
+    # Plain least-squares OLS exposing the fields generate_conclusion and the summary need
+    y, X = dmatrices(formula, df, return_type='dataframe')
+    y, Xv = y.to_numpy().ravel(), X.to_numpy()
+    beta, ssr, rank = _lstsq_fit(Xv, y)
+    df_resid = len(y) - rank
+    bse = np.sqrt(np.diag(np.linalg.pinv(Xv.T @ Xv)) * ssr / df_resid)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = beta / bse
+    p = 2 * stats.t.sf(np.abs(t), df_resid)
+    tss = ((y - y.mean()) ** 2).sum()
+    cols = X.columns
+    return RegressionFit(pd.Series(beta, index=cols), pd.Series(bse, index=cols), pd.Series(t, index=cols),
+                         pd.Series(p, index=cols), 1 - ssr / tss, len(y), df_resid)
+
+def regression_summary(model, formula):
+    table = pd.DataFrame({'coef': model.params, 'std err': model.bse, 't': model.tvalues, 'P>|t|': model.pvalues})
+    return (
+        f"OLS Regression Results: {formula}\n"
+        f"No. Observations: {model.nobs}   Df Residuals: {model.df_resid}   R-squared: {model.rsquared:.3f}\n\n"
+        + table.to_string(float_format=lambda v: f"{v:.4f}")
+    )
+
+def run_regression(df, response_var, num_var, cat_var, use_fast=True):
+    return _run_regression(_FitData(df, [response_var, num_var, cat_var]), response_var, num_var, cat_var, use_fast)
+
+@lru_cache(maxsize=32)
+def _run_regression(data, response_var, num_var, cat_var, use_fast):
+    df = data.df
     formula = f"{response_var} ~ {num_var} * C({cat_var})"
-    model = ols(formula, data=df).fit()
-    return model, model.summary().as_text()
+    if not use_fast:
+        model = ols(formula, data=df).fit()
+        return model, model.summary().as_text()
+    model = _ols_fit(formula, df)
+    return model, regression_summary(model, formula)
+
+def save_filtered_data(df, output_dir):
+    # CSV always via pandas so the file is identical with or without pyarrow; Parquet is the optional extra
+    df.to_csv(os.path.join(output_dir, "filtered_data.csv"), index=False)
+    if pa is None:
+        return None
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        pa_parquet.write_table(table, os.path.join(output_dir, "filtered_data.parquet"), compression='zstd')
+    except (pa.ArrowException, TypeError, ValueError) as e:
+        return f"Parquet export skipped: {e}"
+    return None
 
 # ========== 📁 OUTPUT FOLDER CREATION ==========
 
@@ -138,60 +319,116 @@ def generate_conclusion(model, response_var, cat_factor):
         f"This effect was {sig} (p = {p_value:.4f})."
     )
 
-    for term in model.params.index:
-        if "Dose_numeric:C(" in term and model.pvalues[term] < 0.05:
-            factor_name = term.split(":")[1].split("[")[0].replace("C(", "").replace(")", "")
-            level = term.split("[T.")[1].split("]")[0]
-            conclusion += f" There is also evidence that dose effect differs for group '{level}' of factor '{factor_name}'."
+    # Significant dose interactions, filtered and parsed in one vectorized pass over the term names
+    idx = model.params.index
+    sig = idx.str.startswith('Dose_numeric:C(') & (model.pvalues.reindex(idx).to_numpy() < 0.05)
+    parts = idx[sig].str.extract(r'Dose_numeric:C\((?P<factor>[^)]+)\)\[T\.(?P<level>[^\]]+)\]')
+    for factor_name, level in zip(parts['factor'], parts['level']):
+        conclusion += f" There is also evidence that dose effect differs for group '{level}' of factor '{factor_name}'."
 
     return conclusion
 
+# ========== 📦 GROUPED DISTRIBUTION PLOTS ==========
+
+def box_stats(df, x, y, order=None):
+    # Tukey box statistics (1.5·IQR whiskers) for every group in one groupby pass, ready for ax.bxp
+    g = df.groupby(x, observed=True)[y]
+    q = g.quantile([0.25, 0.5, 0.75]).unstack()
+    if order is not None:
+        q = q.reindex(order).dropna(how='all')
+    iqr = q[0.75] - q[0.25]
+    lo = (q[0.25] - 1.5 * iqr).reindex(df[x].to_numpy()).to_numpy()
+    hi = (q[0.75] + 1.5 * iqr).reindex(df[x].to_numpy()).to_numpy()
+    vals = df[y].to_numpy()
+    inside = (vals >= lo) & (vals <= hi)
+    whislo = df[inside].groupby(x, observed=True)[y].min()
+    whishi = df[inside].groupby(x, observed=True)[y].max()
+    fliers = df[~inside & ~np.isnan(lo)].groupby(x, observed=True)[y].apply(np.asarray)
+    return [{
+        'label': level, 'q1': q.at[level, 0.25], 'med': q.at[level, 0.5], 'q3': q.at[level, 0.75],
+        'whislo': whislo.get(level, q.at[level, 0.25]), 'whishi': whishi.get(level, q.at[level, 0.75]),
+        'fliers': fliers.get(level, np.array([])),
+    } for level in q.index]
+
+def draw_violins(ax, df, x, y, box, width=0.8):
+    # Violins from one gaussian_kde per group; quartile lines reuse the box_stats quantiles
+    groups = df.groupby(x, observed=True)[y].apply(np.asarray)
+    curves = []
+    for b in box:
+        arr = groups[b['label']]
+        try:
+            kde = stats.gaussian_kde(arr)
+            bw = kde.factor * arr.std(ddof=1)
+            ys = np.linspace(arr.min() - 2 * bw, arr.max() + 2 * bw, 200)
+            curves.append((ys, kde(ys)))
+        except (ValueError, np.linalg.LinAlgError):
+            curves.append((np.array([arr.min(), arr.max()]), np.zeros(2)))
+    # Same area for every violin: scale by the largest density across groups
+    peak = max([dens.max() for _, dens in curves] + [1e-12])
+    for pos, (b, (ys, dens)) in enumerate(zip(box, curves)):
+        half = dens / peak * width / 2
+        ax.fill_betweenx(ys, pos - half, pos + half, facecolor='C0', edgecolor='0.25', alpha=0.8)
+        for key in ('q1', 'med', 'q3'):
+            w = np.interp(b[key], ys, half)
+            ax.plot([pos - w, pos + w], [b[key]] * 2, color='0.25', linestyle='--', linewidth=1)
+    ax.set_xticks(range(len(box)), [b['label'] for b in box])
+    ax.set_xlabel(x)
+    ax.set_ylabel(y)
+
 # ========== 📈 REGRESSION COMPARISON PLOT ==========
 
 def plot_regression_models(df, x, y, save_path=None):
-    fig, ax = plt.subplots(figsize=(10, 6))
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
     ax.scatter(df[x], df[y], alpha=0.6, label='Data')
 
     models = {}
     x_vals = np.linspace(df[x].min(), df[x].max(), 200)
 
-    # Linear
-    lin = np.polyfit(df[x], df[y], 1)
-    models['Linear'] = (x_vals, np.polyval(lin, x_vals))
-
-    # Poly2
-    poly2 = np.polyfit(df[x], df[y], 2)
-    models['Poly2'] = (x_vals, np.polyval(poly2, x_vals))
-
-    # Poly3
-    poly3 = np.polyfit(df[x], df[y], 3)
-    models['Poly3'] = (x_vals, np.polyval(poly3, x_vals))
-
-    # Exponential (fit only on positive y)
+    # Polynomials: one shared Vandermonde (column-scaled like polyfit), degree d uses its last d+1 columns
+    V = np.vander(df[x].to_numpy(dtype=float), 4)
+    scale = np.sqrt((V * V).sum(axis=0))
+    V_eval = np.vander(x_vals, 4)
+    y_arr = df[y].to_numpy(dtype=float)
+    for name, deg in [('Linear', 1), ('Poly2', 2), ('Poly3', 3)]:
+        k = 3 - deg
+        coefs = np.linalg.lstsq(V[:, k:] / scale[k:], y_arr, rcond=None)[0] / scale[k:]
+        models[name] = (x_vals, V_eval[:, k:] @ coefs)
+
+    # Log-Linear (log(y) = a + b * x) on positive y; also the starting point of the exponential fit
+    loglin = None
     try:
-        df_exp = df[df[y] > 0]
-        popt, _ = curve_fit(lambda x, a, b: a * np.exp(b * x), df_exp[x], df_exp[y], maxfev=10000)
-        models['Exponential'] = (x_vals, popt[0] * np.exp(popt[1] * x_vals))
+        df_pos = df[df[y] > 0]
+        x_pos = df_pos[x].to_numpy(dtype=float)
+        y_pos = df_pos[y].to_numpy(dtype=float)
+        loglin = np.polyfit(x_pos, np.log(y_pos), 1)
     except Exception:
         pass
 
-    # Logarithmic (fit on x > 0)
+    # Exponential (y = a * exp(b * x)), refined from the log-linear solution with an analytic Jacobian
     try:
-        df_log = df[df[x] > 0]
-        popt, _ = curve_fit(lambda x, a, b: a + b * np.log(x), df_log[x], df_log[y])
-        models['Logarithmic'] = (x_vals, popt[0] + popt[1] * np.log(x_vals))
+        b0, log_a0 = loglin
+        def exp_resid(p):
+            return p[0] * np.exp(p[1] * x_pos) - y_pos
+        def exp_jac(p):
+            e = np.exp(p[1] * x_pos)
+            return np.column_stack([e, p[0] * x_pos * e])
+        popt = least_squares(exp_resid, [np.exp(log_a0), b0], jac=exp_jac, method='lm').x
+        models['Exponential'] = (x_vals, popt[0] * np.exp(popt[1] * x_vals))
     except Exception:
         pass
 
-    # Log-Linear (log(y) = a + b * x)
+    # Logarithmic (y = a + b * log(x), linear in log(x); fit on x > 0)
     try:
-        df_loglin = df[df[y] > 0]
-        log_y = np.log(df_loglin[y])
-        linfit = np.polyfit(df_loglin[x], log_y, 1)
-        models['Log-Linear'] = (x_vals, np.exp(linfit[1] + linfit[0] * x_vals))
+        df_log = df[df[x] > 0]
+        b, a = np.polyfit(np.log(df_log[x].to_numpy(dtype=float)), df_log[y].to_numpy(dtype=float), 1)
+        models['Logarithmic'] = (x_vals, a + b * np.log(x_vals))
     except Exception:
         pass
 
+    if loglin is not None:
+        models['Log-Linear'] = (x_vals, np.exp(loglin[1] + loglin[0] * x_vals))
+
     # Plot all models
     for name, (x_, y_) in models.items():
         ax.plot(x_, y_, label=name)
@@ -214,6 +451,9 @@ class AnalyzerApp:
         master.state("zoomed")
 
         self.df = pd.DataFrame()
+        self._figs = []
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self._pending = None
 
         # ==== Layout ====
         main = tk.PanedWindow(master, orient=tk.HORIZONTAL)
@@ -228,7 +468,8 @@ class AnalyzerApp:
         control = tk.LabelFrame(left, text="⚙️ Options")
         control.pack(fill=tk.X, padx=8, pady=5)
 
-        tk.Button(control, text="📁 Load Folder", command=self.load_folder).grid(row=0, column=0)
+        self.load_button = tk.Button(control, text="📁 Load Folder", command=self.load_folder)
+        self.load_button.grid(row=0, column=0)
         tk.Label(control, text="Response:").grid(row=0, column=1)
         self.response_combo = ttk.Combobox(control, width=28, state="readonly")
         self.response_combo.grid(row=0, column=2, columnspan=2)
@@ -262,7 +503,8 @@ class AnalyzerApp:
         self.norm_combo.set("None")
         self.norm_combo.grid(row=3, column=3)
 
-        tk.Button(control, text="🚀 Analyze", command=self.run_analysis, bg="#4CAF50", fg="white").grid(row=4, column=0, columnspan=4, pady=5)
+        self.analyze_button = tk.Button(control, text="🚀 Analyze", command=self.run_analysis, bg="#4CAF50", fg="white")
+        self.analyze_button.grid(row=4, column=0, columnspan=4, pady=5)
 
         # ==== Output Box ====
         out_frame = tk.LabelFrame(left, text="📄 Results")
@@ -292,15 +534,26 @@ class AnalyzerApp:
         self.np_combo.set('--')
 
     def load_folder(self):
+        # The worker reads self.df and the fit cache; don't swap them under a running analysis
+        if self._pending is not None and not self._pending.done():
+            return
         folder = filedialog.askdirectory()
         if not folder: return
         self.df = load_all_aggregated_data(folder)
+        clear_fit_cache()
         if self.df.empty:
             messagebox.showerror("Error", "No data found.")
             return
         for col in ['CellLine', 'NP', 'Radiation', 'Dose']:
-            self.df[col] = self.df[col].astype(str).str.strip()
+            self.df[col] = self.df[col].astype(str).str.strip().astype('category')
+        # float32 is plenty for the measurements and halves the bytes every later stage moves
+        num_cols = self.df.select_dtypes(include=[np.float64]).columns
+        self.df[num_cols] = self.df[num_cols].astype(np.float32)
         self.response_combo['values'] = list(self.df.select_dtypes(include=np.number).columns)
+        # Parse each dose level once; rows pick their value by category code (-1 -> trailing NaN)
+        doses = self.df['Dose'].cat
+        levels = pd.to_numeric(doses.categories.str.replace("Gy", "", regex=False).str.strip(), errors='coerce')
+        self.df['Dose_numeric'] = np.append(levels.to_numpy(dtype=np.float32), np.float32(np.nan))[doses.codes.to_numpy()]
         self.response_combo.set("")
         self.cellline_combo['values'] = ['--'] + sorted(self.df['CellLine'].unique())
         self.cellline_combo.set('--')
@@ -314,33 +567,57 @@ class AnalyzerApp:
             messagebox.showerror("Error", "Load data first.")
             return
 
-        df = self.df.copy()
         y = self.response_combo.get()
         factors = [f for f, v in self.factor_vars.items() if v.get()]
         if not y or not factors:
             self.log("❗ Select a response variable and factors.")
             return
 
-        # Filters
-        if (cl := self.cellline_combo.get()) != '--':
-            df = df[df['CellLine'] == cl]
-        if (np_type := self.np_combo.get()) != '--':
-            df = df[df['NP'] == np_type]
-        df['Dose_numeric'] = pd.to_numeric(df['Dose'].str.replace("Gy", "").str.strip(), errors='coerce')
-        df = df.dropna(subset=[y])
-
-        if self.derived_var.get():
+        # Widgets are read here; the fits, plots and file writes run on the worker thread
+        self.analyze_button.config(state=tk.DISABLED)
+        self.load_button.config(state=tk.DISABLED)
+        self.log("⏳ Running analysis...")
+        fut = self.executor.submit(self._do_analysis, self.df, y, factors, self.cellline_combo.get(),
+                                   self.np_combo.get(), self.derived_var.get(), self.outlier_var.get(),
+                                   self.norm_combo.get())
+        self._pending = fut
+        fut.add_done_callback(lambda f: self.master.after(0, self._render, f))
+
+    def _do_analysis(self, data, y, factors, cl, np_type, derived, outliers, norm):
+        # Always hand back what was collected, so an unexpected error keeps the earlier log lines
+        result = {'logs': [], 'grid_fig': None, 'figs': []}
+        try:
+            self._analysis_steps(result, data, y, factors, cl, np_type, derived, outliers, norm)
+        except Exception as e:
+            result['logs'].append(f"❌ Analysis failed: {e}")
+        return result
+
+    def _analysis_steps(self, result, data, y, factors, cl, np_type, derived, outliers, norm):
+        log = result['logs'].append
+
+        # Filters: combine into one mask and select rows once instead of copying the whole frame
+        mask = data[y].notna().to_numpy(copy=True)
+        if cl != '--':
+            mask &= (data['CellLine'] == cl).to_numpy()
+        if np_type != '--':
+            mask &= (data['NP'] == np_type).to_numpy()
+        df = data.loc[mask].reset_index(drop=True)
+        # Drop levels filtered out above so C(f) terms don't get empty columns
+        for col in df.select_dtypes(include='category'):
+            df[col] = df[col].cat.remove_unused_categories()
+
+        if derived:
             df = create_derived_vars(df)
-            self.log("📐 Derived variables added.")
-        if self.outlier_var.get():
+            log("📐 Derived variables added.")
+        if outliers:
             df, out = remove_outliers(df, y)
-            self.log(f"🧹 Removed outliers: {out}")
+            log(f"🧹 Removed outliers: {out}")
         if df.empty or len(df) < 5:
-            self.log("⚠️ Too few data points.")
+            log("⚠️ Too few data points.")
             return
-        if (norm := self.norm_combo.get()) != "None":
+        if norm != "None":
             df = apply_normalization(df, y, norm)
-            self.log(f"📊 Normalized using: {norm}")
+            log(f"📊 Normalized using: {norm}")
 
         output_dir = make_output_dir(cl or "ALL", "ALL", np_type or "ALL")
 
@@ -348,25 +625,25 @@ class AnalyzerApp:
         try:
             model, anova = perform_anova(df, y, factors)
             anova.to_csv(os.path.join(output_dir, "anova.csv"))
-            self.log("📈 ANOVA:\n" + anova.to_string())
+            log("📈 ANOVA:\n" + anova.to_string())
         except Exception as e:
-            self.log(f"❌ ANOVA failed: {e}")
+            log(f"❌ ANOVA failed: {e}")
             return
 
         # === Tukey
         for f in factors:
             try:
-                result, data = run_tukey(df, y, f)
-                pd.DataFrame(data[1:], columns=data[0]).to_csv(os.path.join(output_dir, f'tukey_{f}.csv'), index=False)
-                self.log(f"📌 Tukey HSD ({f}):\n{result}")
+                tukey, rows = run_tukey(df, y, f)
+                pd.DataFrame(rows[1:], columns=rows[0]).to_csv(os.path.join(output_dir, f'tukey_{f}.csv'), index=False)
+                log(f"📌 Tukey HSD ({f}):\n{tukey}")
             except Exception as e:
-                self.log(f"❌ Tukey error ({f}): {e}")
+                log(f"❌ Tukey error ({f}): {e}")
 
-        # === Main Plot Grid
+        # === Main Plot Grid (a standalone Figure, embedded in Tk later by _render)
         try:
-            from matplotlib.figure import Figure
-            import matplotlib.pyplot as plt
-            fig, axs = plt.subplots(2, 2, figsize=(12, 8))
+            fig = Figure(figsize=(12, 8))
+            axs = fig.subplots(2, 2)
+            result['figs'].append(fig)
             fig.suptitle(f'{y} vs Factors', fontsize=16)
 
             try:
@@ -374,28 +651,26 @@ class AnalyzerApp:
             except:
                 order = None
 
-            sns.violinplot(data=df, x='Dose', y=y, ax=axs[0, 0], inner='quartile', order=order)
+            box = box_stats(df, 'Dose', y, order)
+            draw_violins(axs[0, 0], df, 'Dose', y, box)
             axs[0, 0].set_title("Violin Plot")
 
-            sns.boxplot(data=df, x='Dose', y=y, ax=axs[0, 1], order=order)
+            axs[0, 1].bxp(box, positions=range(len(box)), patch_artist=True)
+            axs[0, 1].set_xlabel('Dose')
+            axs[0, 1].set_ylabel(y)
             axs[0, 1].set_title("Boxplot")
 
             sns.histplot(data=df, x=y, kde=True, ax=axs[1, 0])
             axs[1, 0].set_title("Histogram")
 
-            sns.regplot(data=df, x='Dose_numeric', y=y, ax=axs[1, 1], scatter=True)
+            sns.regplot(data=df, x='Dose_numeric', y=y, ax=axs[1, 1], scatter=True, ci=None, scatter_kws={'s': 10})
             axs[1, 1].set_title("Linear Regression")
 
             fig.tight_layout()
             fig.savefig(os.path.join(output_dir, f"{y}_plot_grid.png"))
-
-            for widget in self.graph_canvas_container.winfo_children():
-                widget.destroy()
-            canvas = FigureCanvasTkAgg(fig, master=self.graph_canvas_container)
-            canvas.draw()
-            canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+            result['grid_fig'] = fig
         except Exception as e:
-            self.log(f"❌ Grid plot error: {e}")
+            log(f"❌ Grid plot error: {e}")
 
         # === Regression + Conclusion + Regressions plot
         try:
@@ -404,20 +679,50 @@ class AnalyzerApp:
                 model, summary = run_regression(df, y, 'Dose_numeric', cat)
                 with open(os.path.join(output_dir, "regression.txt"), "w") as f:
                     f.write(summary)
-                self.log("\n📉 Regression summary:\n" + summary.splitlines()[0])
+                log("\n📉 Regression summary:\n" + summary.splitlines()[0])
 
                 conclusion = generate_conclusion(model, y, cat)
                 with open(os.path.join(output_dir, "conclusion.txt"), "w") as f:
                     f.write(conclusion)
-                self.log("\n🧠 Conclusion:\n" + conclusion)
+                log("\n🧠 Conclusion:\n" + conclusion)
 
                 reg_fig = plot_regression_models(df, "Dose_numeric", y,
                             save_path=os.path.join(output_dir, f"{y}_regression_models.png"))
+                result['figs'].append(reg_fig)
+        except Exception as e:
+            log(f"❌ Regression error: {e}")
+
+        if (err := save_filtered_data(df, output_dir)):
+            log(f"⚠️ {err}")
+        log(f"\n✅ Saved in: {output_dir}")
+
+    def _render(self, fut):
+        # Tk thread only: show the worker's log lines and swap in the new plot grid
+        self.analyze_button.config(state=tk.NORMAL)
+        self.load_button.config(state=tk.NORMAL)
+        self._pending = None
+        try:
+            result = fut.result()
         except Exception as e:
-            self.log(f"❌ Regression error: {e}")
+            self.log(f"❌ Analysis failed: {e}")
+            return
+        for line in result['logs']:
+            self.log(line)
+        if result['grid_fig'] is None:
+            # Nothing to show: release this run's figures (e.g. the regression plot) right away
+            for fig in result['figs']:
+                fig.clear()
+            return
 
-        df.to_csv(os.path.join(output_dir, "filtered_data.csv"), index=False)
-        self.log(f"\n✅ Saved in: {output_dir}")
+        for widget in self.graph_canvas_container.winfo_children():
+            widget.destroy()
+        # Figures stay out of pyplot's registry; release the previous run's ones
+        for old_fig in self._figs:
+            old_fig.clear()
+        self._figs = result['figs']
+        canvas = FigureCanvasTkAgg(result['grid_fig'], master=self.graph_canvas_container)
+        canvas.draw()
+        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
 
 
 # ====== RUN APP ======